@@ -0,0 +1,292 @@
+"""Shared ACP client for the test scripts
+
+Wraps a `crow-agent acp` subprocess and the JSON-RPC plumbing the scripts
+in this directory need. The same Client backs both standalone runs
+(`python3 scripts/test_acp_basic.py`) and the session-scoped pytest
+fixture in conftest.py, which keeps one agent alive across tests.
+
+When CROW_ACP_SOCKET is set, clients connect to the shared agent behind
+acp_server.py instead of starting their own. CROW_TEST_CPUS=AGENT,HARNESS
+pins a spawned agent and the client to fixed CPUs (Linux only).
+"""
+
+import functools
+import io
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+
+    def dumps(obj):
+        """Serialize to compact JSON bytes, matching orjson.dumps"""
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+BINARY = "./target/release/crow-agent"
+SOCKET = os.environ.get("CROW_ACP_SOCKET")
+# Per-chunk logging is costly on long streams, so it is opt-in
+VERBOSE = os.environ.get("CROW_TEST_VERBOSE") == "1"
+CPUS = os.environ.get("CROW_TEST_CPUS")
+
+INITIALIZE_PARAMS = {"protocolVersion": "0.1"}
+
+# JSON-RPC envelopes; only the method and params are encoded per message
+_RPC_FMT = b'{"jsonrpc":"2.0","method":%b,"params":%b,"id":%d}\n'
+_NOTIFY_FMT = b'{"jsonrpc":"2.0","method":%b,"params":%b}\n'
+_PROMPT_FMT = (
+    b'{"jsonrpc":"2.0","method":"session/prompt",'
+    b'"params":{"sessionId":%b,"prompt":%b},"id":%d}\n'
+)
+# Most frames a single os.writev call accepts
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+
+@functools.cache
+def agent_available(binary=BINARY):
+    """Whether a relay socket is configured or the agent binary is built"""
+    return bool(SOCKET) or os.access(binary, os.X_OK)
+
+
+def pin_cpus(pid):
+    """Pin the agent and this thread to the CPUs named in $CROW_TEST_CPUS
+
+    The value is "AGENT,HARNESS", e.g. "2,3"; picking SMT siblings keeps
+    pipe traffic between the two processes on a shared core for steadier
+    benchmark numbers. Threads started afterwards inherit the harness CPU.
+    Does nothing when unset or off Linux.
+    """
+    if not CPUS or not hasattr(os, "sched_setaffinity"):
+        return
+    agent, harness = (int(cpu) for cpu in CPUS.split(","))
+    os.sched_setaffinity(pid, {agent})
+    os.sched_setaffinity(0, {harness})
+
+
+def write_frames(fd, frames):
+    """Write already-encoded messages to `fd` with as few syscalls as possible
+
+    os.writev hands up to IOV_MAX frames to the kernel in one call,
+    skipping both the join and the buffered writer's copy; the loop only
+    runs again for longer batches or when the pipe or socket accepts a
+    partial write.
+    """
+    frames = [memoryview(frame) for frame in frames]
+    i = 0
+    while i < len(frames):
+        written = os.writev(fd, frames[i : i + _IOV_MAX])
+        while i < len(frames) and written >= len(frames[i]):
+            written -= len(frames[i])
+            i += 1
+        if written:
+            frames[i] = frames[i][written:]
+
+
+def prebuild_prompt(text):
+    """Encode a text prompt's content blocks once, for reuse across sends"""
+    return dumps([{"type": "text", "text": text}])
+
+
+class LineReader:
+    """Splits a raw fd into lines, reading up to 64KB per syscall"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = b""
+
+    def readline(self):
+        """Return the next line without its newline, or None at EOF"""
+        while b"\n" not in self.buf:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                line, self.buf = self.buf, b""
+                return line or None
+            self.buf += chunk
+        line, _, self.buf = self.buf.partition(b"\n")
+        return line
+
+    def read_lines(self):
+        """Return every complete line from the next read, or None at EOF
+
+        Splitting a whole 64KB read at once avoids re-scanning and copying
+        the buffer for each of the many small lines a stream produces.
+        Lines already buffered by readline() are returned without reading.
+        """
+        if b"\n" in self.buf:
+            *lines, self.buf = self.buf.split(b"\n")
+            return lines
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                rest, self.buf = self.buf, b""
+                return [rest] if rest else None
+            *lines, self.buf = (self.buf + chunk).split(b"\n")
+            if lines:
+                return lines
+
+
+def _read_messages(fd, messages):
+    """Parse each batch of lines the agent writes until its stdout closes
+
+    The thread ends by queueing an exception, either the one that stopped
+    it (e.g. a line that isn't JSON) or EOFError once the agent is gone,
+    so readers fail fast instead of waiting out their timeout.
+    """
+    reader = LineReader(fd)
+    try:
+        while (lines := reader.read_lines()) is not None:
+            for line in lines:
+                if line:
+                    messages.put(loads(line))
+    except Exception as e:
+        messages.put(e)
+    else:
+        messages.put(EOFError("agent closed its output"))
+
+
+class Client:
+    """JSON-RPC connection to a `crow-agent acp` agent
+
+    Starts a private agent subprocess, or connects to the relay listening
+    on `socket_path` when one is given.
+    """
+
+    def __init__(self, binary=BINARY, socket_path=SOCKET):
+        if socket_path:
+            self.proc = None
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+            fd = self._fd = self.sock.fileno()
+        else:
+            self.sock = None
+            self.proc = subprocess.Popen(
+                [binary, "acp"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # All I/O goes through os.read/os.writev on the raw fds
+                bufsize=0,
+            )
+            self._fd = self.proc.stdin.fileno()
+            fd = self.proc.stdout.fileno()
+            pin_cpus(self.proc.pid)
+        self.messages = queue.Queue()
+        self._next_id = 1
+        self._reader = threading.Thread(
+            target=_read_messages, args=(fd, self.messages), daemon=True
+        )
+        self._reader.start()
+
+    def close(self):
+        """Stop the agent process, or disconnect from the relay"""
+        if self.sock:
+            # Wake the reader with EOF and let it finish before the fd is
+            # closed, so it never reads a closed (or reused) descriptor
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self._reader.join()
+            self.sock.close()
+        else:
+            self.proc.terminate()
+            self.proc.wait()
+
+    def _write(self, *frames):
+        write_frames(self._fd, frames)
+
+    def request(self, method, params):
+        """Send JSON-RPC request, returning its id"""
+        id = self._next_id
+        self._next_id += 1
+        self._write(_RPC_FMT % (dumps(method), dumps(params), id))
+        return id
+
+    def notify(self, method, params):
+        """Send JSON-RPC notification (no id)"""
+        self._write(_NOTIFY_FMT % (dumps(method), dumps(params)))
+
+    def read(self, timeout=30, session_id=None):
+        """Read the next JSON-RPC message, or None on timeout
+
+        With `session_id`, session/update notifications for other sessions
+        are dropped; sessions sharing a client (e.g. across pytest tests)
+        can still be streaming after their own test has moved on.
+
+        Raises whatever stopped the reader thread, including EOFError once
+        the agent has exited.
+        """
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                message = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if isinstance(message, Exception):
+                # Leave it queued so every later read fails the same way
+                self.messages.put(message)
+                raise message
+            if (
+                session_id is None
+                or message.get("method") != "session/update"
+                or message["params"].get("sessionId") == session_id
+            ):
+                return message
+        return None
+
+    def wait_result(self, id, session_id=None, timeout=60, text_limit=None):
+        """Read until the response for `id` arrives, collecting agent text
+
+        Only text from `session_id` is collected when one is given.
+        Returns (response, text); response is None if the timeout expires.
+        With `text_limit`, chunks stop being kept once the text is longer
+        than that, so callers that only print a preview don't hold the rest.
+        """
+        text = io.StringIO()
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            resp = self.read(timeout=remaining, session_id=session_id)
+            if not resp:
+                continue
+            if resp.get("method") == "session/update":
+                update = resp["params"]["update"]
+                if update.get("sessionUpdate") == "agent_message_chunk":
+                    if text_limit is None or text.tell() <= text_limit:
+                        text.write(update["content"].get("text", ""))
+            elif resp.get("id") == id:
+                return resp, text.getvalue()
+        return None, text.getvalue()
+
+    def initialize(self):
+        """Perform the ACP handshake, returning the response"""
+        id = self.request("initialize", INITIALIZE_PARAMS)
+        return self.wait_result(id, timeout=30)[0]
+
+    def new_session(self, cwd="/tmp"):
+        """Create a session rooted at `cwd`, returning the response"""
+        id = self.request("session/new", {"cwd": cwd, "mcpServers": []})
+        return self.wait_result(id, timeout=30)[0]
+
+    def prompt(self, session_id, prompt):
+        """Send a prompt to a session, returning the request id
+
+        `prompt` is either plain text or the output of prebuild_prompt().
+        """
+        if isinstance(prompt, str):
+            prompt = prebuild_prompt(prompt)
+        id = self._next_id
+        self._next_id += 1
+        self._write(_PROMPT_FMT % (dumps(session_id), prompt, id))
+        return id
+
+    def cancel(self, session_id):
+        """Ask the agent to cancel the session's in-flight prompt"""
+        self.notify("session/cancel", {"sessionId": session_id})
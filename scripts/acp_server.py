@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Share one ACP agent between several clients over a UNIX socket
+
+Starts `crow-agent acp` once and relays newline-delimited JSON-RPC between
+it and any number of socket connections:
+- request ids are rewritten so concurrent clients never collide, and each
+  response goes back to the connection that sent the request
+- session notifications go to the connection that created the session
+- initialize is answered from the relay's own handshake, so every client
+  can send it without reinitializing the agent
+
+Clients built with _acp_client.Client connect automatically when
+CROW_ACP_SOCKET is set, which lets the test scripts run in parallel
+against a single agent.
+
+Usage:
+    python3 scripts/acp_server.py --socket /tmp/crow-acp.sock
+    # -n needs pytest-xdist (pip install pytest-xdist)
+    CROW_ACP_SOCKET=/tmp/crow-acp.sock python3 -m pytest -n 3 scripts/
+    # or, without xdist, run scripts side by side
+    export CROW_ACP_SOCKET=/tmp/crow-acp.sock
+    python3 scripts/test_acp_basic.py & python3 scripts/test_acp_cancel.py & wait
+"""
+
+import argparse
+import itertools
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+
+from _acp_client import (
+    BINARY,
+    INITIALIZE_PARAMS,
+    LineReader,
+    dumps,
+    loads,
+    pin_cpus,
+    write_frames,
+)
+
+DEFAULT_SOCKET = "/tmp/crow-acp.sock"
+
+
+class Relay:
+    """Multiplexes socket connections onto one agent subprocess"""
+
+    def __init__(self, binary):
+        self.proc = subprocess.Popen(
+            [binary, "acp"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            # All I/O goes through os.read/os.writev on the raw fds
+            bufsize=0,
+            # Keep Ctrl-C away from the agent; the relay shuts it down
+            start_new_session=True,
+        )
+        pin_cpus(self.proc.pid)
+        # Guards the routing tables below; no I/O happens while it is held,
+        # so a client that stops reading can't stall the others
+        self.lock = threading.Lock()
+        # Serializes writes to agent stdin from the per-client threads
+        self.agent_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.pending = {}  # agent-side request id -> (conn, client id, method)
+        self.sessions = {}  # sessionId -> conn that created it
+        self.outboxes = {}  # conn -> queue of encoded messages for it
+        self.init_result = None
+        self.closing = False
+        self.server = None  # listening socket, shut down if the agent exits
+        self.agent_exited = False
+
+    def start(self):
+        """Initialize the agent and start routing its output"""
+        reader = LineReader(self.proc.stdout.fileno())
+        self._to_agent(
+            [
+                {
+                    "jsonrpc": "2.0",
+                    "method": "initialize",
+                    "params": INITIALIZE_PARAMS,
+                    "id": 0,
+                }
+            ]
+        )
+        line = reader.readline()
+        resp = loads(line) if line else None
+        if not resp or "result" not in resp:
+            raise RuntimeError(f"Bad initialize response: {resp}")
+        self.init_result = resp["result"]
+        threading.Thread(target=self._from_agent, args=(reader,), daemon=True).start()
+
+    def close(self):
+        """Stop the agent process"""
+        self.closing = True
+        self.proc.terminate()
+        self.proc.wait()
+
+    def serve(self, server):
+        """Accept and relay connections until the agent exits"""
+        with self.lock:
+            if self.agent_exited:
+                return
+            self.server = server
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                # _from_agent shut the listener down
+                return
+            self.add(conn)
+
+    def add(self, conn):
+        """Start relaying for a newly accepted connection"""
+        outbox = queue.Queue()
+        with self.lock:
+            self.outboxes[conn] = outbox
+        threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+        threading.Thread(target=self._drain, args=(conn, outbox), daemon=True).start()
+
+    def _to_agent(self, messages):
+        write_frames(
+            self.proc.stdin.fileno(), [dumps(message) + b"\n" for message in messages]
+        )
+
+    def _send(self, conn, message):
+        outbox = self.outboxes.get(conn)
+        if outbox is not None:
+            outbox.put(dumps(message) + b"\n")
+
+    def _drain(self, conn, outbox):
+        """Write queued messages to one connection, closing it when done"""
+        while (data := outbox.get()) is not None:
+            try:
+                conn.sendall(data)
+            except OSError:
+                # The client went away; _serve ends the queue once its read fails
+                pass
+        conn.close()
+
+    def _serve(self, conn):
+        """Forward one connection's messages to the agent"""
+        reader = LineReader(conn.fileno())
+        try:
+            while (lines := reader.read_lines()) is not None:
+                messages = [loads(line) for line in lines if line]
+                with self.lock:
+                    forward = [m for m in messages if self._from_client(conn, m)]
+                # Forward the whole batch to the agent in one writev
+                with self.agent_lock:
+                    self._to_agent(forward)
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                outbox = self.outboxes.pop(conn)
+                self.sessions = {
+                    s: c for s, c in self.sessions.items() if c is not conn
+                }
+                self.pending = {
+                    i: p for i, p in self.pending.items() if p[0] is not conn
+                }
+            # Let _drain flush what is queued, then close the socket
+            outbox.put(None)
+
+    def _from_client(self, conn, message):
+        """Rewrite a client message for the agent; False if answered here"""
+        if message.get("method") == "initialize":
+            self._send(
+                conn,
+                {"jsonrpc": "2.0", "id": message["id"], "result": self.init_result},
+            )
+            return False
+        if "method" in message and "id" in message:
+            agent_id = next(self.ids)
+            self.pending[agent_id] = (conn, message["id"], message["method"])
+            message["id"] = agent_id
+        return True
+
+    def _from_agent(self, reader):
+        """Route each batch of agent messages to the connections they belong to"""
+        try:
+            while (lines := reader.read_lines()) is not None:
+                messages = [loads(line) for line in lines if line]
+                with self.lock:
+                    for message in messages:
+                        self._route(message)
+        finally:
+            # Without this thread nothing reaches the clients, so wake
+            # serve() out of accept() and let main() clean up
+            with self.lock:
+                self.agent_exited = True
+                if not self.closing:
+                    print("Agent exited", file=sys.stderr)
+                    if self.server is not None:
+                        try:
+                            self.server.shutdown(socket.SHUT_RDWR)
+                        except OSError:
+                            pass
+
+    def _route(self, message):
+        if "method" not in message:
+            # Response: hand back under the id the client chose
+            conn, id, method = self.pending.pop(message.get("id"), (None, None, None))
+            if conn is None:
+                return
+            message["id"] = id
+            if method == "session/new" and "result" in message:
+                self.sessions[message["result"]["sessionId"]] = conn
+            self._send(conn, message)
+            return
+
+        session_id = (message.get("params") or {}).get("sessionId")
+        if session_id is None:
+            targets = list(self.outboxes)
+        elif session_id in self.sessions:
+            targets = [self.sessions[session_id]]
+        else:
+            targets = []
+        for conn in targets:
+            self._send(conn, message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--socket", default=DEFAULT_SOCKET, help="socket path to listen on"
+    )
+    parser.add_argument("--binary", default=BINARY, help="crow-agent binary to run")
+    args = parser.parse_args()
+    if not os.access(args.binary, os.X_OK):
+        print(f"{args.binary} not found; run cargo build --release", file=sys.stderr)
+        return 2
+
+    relay = Relay(args.binary)
+    relay.start()
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(args.socket)
+    server.listen()
+    print(f"Relaying {args.binary} acp on {args.socket}")
+
+    try:
+        relay.serve(server)
+        # serve() only returns once the agent is gone
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        server.close()
+        os.unlink(args.socket)
+        relay.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
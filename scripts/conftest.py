@@ -0,0 +1,37 @@
+"""Pytest fixtures for the ACP test scripts
+
+One agent process is started per pytest session and shared by every test;
+each test gets its own ACP session so conversation history stays isolated.
+With CROW_ACP_SOCKET set, tests instead connect to the agent behind
+acp_server.py, so parallel workers share a single process.
+
+Usage:
+    cargo build --release
+    python3 -m pytest scripts/
+"""
+
+import pytest
+
+from _acp_client import BINARY, Client, agent_available
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Initialized client for a single long-lived `crow-agent acp` process"""
+    if not agent_available():
+        pytest.skip(f"{BINARY} not found; run cargo build --release")
+    client = Client()
+    try:
+        resp = client.initialize()
+        assert resp and "result" in resp, f"Bad initialize response: {resp}"
+        yield client
+    finally:
+        client.close()
+
+
+@pytest.fixture
+def session_id(client):
+    """Fresh ACP session for each test"""
+    resp = client.new_session("/tmp")
+    assert resp and "result" in resp, f"Bad session/new response: {resp}"
+    return resp["result"]["sessionId"]
@@ -9,51 +9,115 @@ This script tests basic ACP functionality:
 
 Usage:
     python3 scripts/test_acp_basic.py
+    CROW_TEST_VERBOSE=1 python3 scripts/test_acp_basic.py  # print every chunk
 """
 
-import json
-import select
-import subprocess
 import sys
+import time
 
+from _acp_client import BINARY, VERBOSE, Client, agent_available, prebuild_prompt
 
-def send_jsonrpc(proc, method, params, id):
-    """Send JSON-RPC request"""
-    request = {"jsonrpc": "2.0", "method": method, "params": params, "id": id}
-    msg = json.dumps(request)
-    proc.stdin.write(msg + "\n")
-    proc.stdin.flush()
+PROMPT = prebuild_prompt("Say hello in exactly 3 words.")
 
 
-def read_response(proc, timeout=30):
-    """Read JSON-RPC response with timeout"""
-    ready, _, _ = select.select([proc.stdout], [], [], timeout)
-    if ready:
-        line = proc.stdout.readline()
-        if line:
-            return json.loads(line)
-    return None
+def _on_text(update, state):
+    text = update["content"].get("text", "")
+    state["text_chunks"].append(text)
+    if VERBOSE:
+        print(f"  Text chunk: {repr(text)}")
+
+
+def _on_thought(update, state):
+    if VERBOSE:
+        print(f"  Thought chunk")
+
+
+def _on_tool(update, state):
+    state["tool_calls"].append(update.get("title", "unknown"))
+    print(f"  Tool call: {update.get('title')}")
+
+
+def _on_tool_done(update, state):
+    print(f"  Tool done: {update.get('toolCallId')}")
+
+
+def _on_plan(update, state):
+    print(f"  Plan update: {len(update.get('entries', []))} entries")
+
+
+def _on_unknown(update, state):
+    print(f"  Update: {update.get('sessionUpdate', 'unknown')}")
+
+
+# session/update handlers keyed by sessionUpdate type
+HANDLERS = {
+    "agent_message_chunk": _on_text,
+    "agent_thought_chunk": _on_thought,
+    "tool_call": _on_tool,
+    "tool_call_update": _on_tool_done,
+    "plan": _on_plan,
+}
+
+
+def run(client, session_id):
+    """Send a simple prompt and check the streamed reply"""
+    # Send prompt
+    print("\n=== Send Prompt ===")
+    prompt_id = client.prompt(session_id, PROMPT)
+
+    # Collect responses
+    print("\n=== Responses ===")
+    state = {"text_chunks": [], "tool_calls": []}
+    resp = None
+    deadline = time.monotonic() + 60
+    while (remaining := deadline - time.monotonic()) > 0:
+        resp = client.read(timeout=remaining, session_id=session_id)
+        if not resp:
+            continue
+
+        if "method" in resp and resp["method"] == "session/update":
+            update = resp["params"]["update"]
+            update_type = update.get("sessionUpdate", "unknown")
+            HANDLERS.get(update_type, _on_unknown)(update, state)
+
+        elif resp.get("id") == prompt_id:
+            # Our response, result or error, ends the turn; stop reading
+            print(f"\n=== Final Result ===")
+            if "result" in resp:
+                print(f"Stop reason: {resp['result']['stopReason']}")
+            else:
+                print(f"Error: {resp.get('error')}")
+            break
+
+    full_response = "".join(state["text_chunks"])
+    print(f"\nFull response: {full_response}")
+    print(f"Tool calls: {state['tool_calls']}")
+
+    if resp and resp.get("result", {}).get("stopReason") == "end_turn":
+        print("\nSUCCESS: Basic ACP test passed!")
+        return 0
+    else:
+        print("\nFAIL: Unexpected stop reason")
+        return 1
+
+
+def test_basic(client, session_id):
+    assert run(client, session_id) == 0
 
 
 def main():
-    binary = "./target/release/crow-agent"
+    if not agent_available():
+        print(f"SKIP: {BINARY} not found; run cargo build --release")
+        return 2
 
     # Start the ACP server
-    print(f"Starting ACP server: {binary} acp")
-    proc = subprocess.Popen(
-        [binary, "acp"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-    )
+    print(f"Starting ACP server: {BINARY} acp")
+    client = Client()
 
     try:
         # Initialize
         print("\n=== Initialize ===")
-        send_jsonrpc(proc, "initialize", {"protocolVersion": "0.1"}, 1)
-        resp = read_response(proc)
+        resp = client.initialize()
         if not resp or "result" not in resp:
             print(f"FAIL: Bad initialize response: {resp}")
             return 1
@@ -63,74 +127,17 @@ def main():
 
         # Create session
         print("\n=== Create Session ===")
-        send_jsonrpc(proc, "session/new", {"cwd": "/tmp", "mcpServers": []}, 2)
-        resp = read_response(proc)
+        resp = client.new_session("/tmp")
         if not resp or "result" not in resp:
             print(f"FAIL: Bad session/new response: {resp}")
             return 1
         session_id = resp["result"]["sessionId"]
         print(f"Session ID: {session_id}")
 
-        # Send prompt
-        print("\n=== Send Prompt ===")
-        send_jsonrpc(
-            proc,
-            "session/prompt",
-            {
-                "sessionId": session_id,
-                "prompt": [{"type": "text", "text": "Say hello in exactly 3 words."}],
-            },
-            3,
-        )
-
-        # Collect responses
-        print("\n=== Responses ===")
-        text_chunks = []
-        tool_calls = []
-        for i in range(100):
-            resp = read_response(proc, timeout=5)
-            if not resp:
-                continue
-
-            if "method" in resp and resp["method"] == "session/update":
-                update = resp["params"]["update"]
-                update_type = update.get("sessionUpdate", "unknown")
-
-                if update_type == "agent_message_chunk":
-                    text = update["content"].get("text", "")
-                    text_chunks.append(text)
-                    print(f"  Text chunk: {repr(text)}")
-                elif update_type == "agent_thought_chunk":
-                    print(f"  Thought chunk")
-                elif update_type == "tool_call":
-                    tool_calls.append(update.get("title", "unknown"))
-                    print(f"  Tool call: {update.get('title')}")
-                elif update_type == "tool_call_update":
-                    print(f"  Tool done: {update.get('toolCallId')}")
-                elif update_type == "plan":
-                    print(f"  Plan update: {len(update.get('entries', []))} entries")
-                else:
-                    print(f"  Update: {update_type}")
-
-            elif "result" in resp:
-                print(f"\n=== Final Result ===")
-                print(f"Stop reason: {resp['result']['stopReason']}")
-                break
-
-        full_response = "".join(text_chunks)
-        print(f"\nFull response: {full_response}")
-        print(f"Tool calls: {tool_calls}")
-
-        if resp and resp.get("result", {}).get("stopReason") == "end_turn":
-            print("\nSUCCESS: Basic ACP test passed!")
-            return 0
-        else:
-            print("\nFAIL: Unexpected stop reason")
-            return 1
+        return run(client, session_id)
 
     finally:
-        proc.terminate()
-        proc.wait()
+        client.close()
 
 
 if __name__ == "__main__":
@@ -4,64 +4,98 @@
 This script tests that the ACP server properly handles cancellation:
 1. Sends initialize and creates a session
 2. Sends a prompt that would take some time
-3. Sends a cancel notification shortly after
+3. Sends a cancel notification once the agent starts responding
 4. Verifies the response has stopReason: cancelled
 
 Usage:
     python3 scripts/test_acp_cancel.py
+    CROW_TEST_VERBOSE=1 python3 scripts/test_acp_cancel.py  # print every notification
 """
-import subprocess
-import json
 import time
-import select
 import sys
 
+from _acp_client import BINARY, VERBOSE, Client, agent_available, prebuild_prompt
 
-def send_jsonrpc(proc, method, params, id):
-    """Send JSON-RPC request"""
-    request = {"jsonrpc": "2.0", "method": method, "params": params, "id": id}
-    msg = json.dumps(request)
-    proc.stdin.write(msg + "\n")
-    proc.stdin.flush()
+PROMPT = prebuild_prompt(
+    "Please think carefully and explain quantum physics in detail."
+)
 
+# Updates that show the prompt is in flight, so a cancel hits a live turn
+CANCEL_TRIGGERS = {"agent_message_chunk", "agent_thought_chunk", "tool_call"}
 
-def send_notification(proc, method, params):
-    """Send JSON-RPC notification (no id)"""
-    request = {"jsonrpc": "2.0", "method": method, "params": params}
-    msg = json.dumps(request)
-    proc.stdin.write(msg + "\n")
-    proc.stdin.flush()
 
+def run(client, session_id):
+    """Start a long prompt, cancel it, and check the stop reason"""
+    # Send a prompt that will take some time
+    print(f"\nSending prompt to session {session_id}...")
+    prompt_id = client.prompt(session_id, PROMPT)
 
-def read_response(proc, timeout=30):
-    """Read JSON-RPC response with timeout"""
-    ready, _, _ = select.select([proc.stdout], [], [], timeout)
-    if ready:
-        line = proc.stdout.readline()
-        if line:
-            return json.loads(line)
-    return None
+    # Cancel on the first sign of output, or after a short wait if none comes
+    cancel_timeout = 0.5
+    print(f"Waiting up to {cancel_timeout}s for the agent to start...")
+    deadline = time.monotonic() + cancel_timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        resp = client.read(timeout=remaining, session_id=session_id)
+        if not resp:
+            continue
+        if resp.get("id") == prompt_id:
+            print(f"\nFAIL: Prompt finished before it could be cancelled: {resp}")
+            return 1
+        update = resp.get("params", {}).get("update", {})
+        if update.get("sessionUpdate") in CANCEL_TRIGGERS:
+            print(f"  Got {update['sessionUpdate']}")
+            break
+    print("Sending cancel notification...")
+    client.cancel(session_id)
+
+    # Read responses until we get the result
+    print("\nWaiting for response...")
+    deadline = time.monotonic() + 40
+    while (remaining := deadline - time.monotonic()) > 0:
+        resp = client.read(timeout=remaining, session_id=session_id)
+        if resp:
+            if "method" in resp:
+                # Notification
+                if VERBOSE:
+                    update = resp.get("params", {}).get("update", {})
+                    update_type = update.get("sessionUpdate", "unknown")
+                    print(f"  Notification: {update_type}")
+            elif resp.get("id") == prompt_id:
+                # Any response to the prompt settles the test
+                if "result" not in resp:
+                    print(f"\nFAIL: Prompt failed: {resp.get('error')}")
+                    return 1
+                stop_reason = resp["result"].get("stopReason")
+                print(f"\n=== Result ===")
+                print(f"Stop reason: {stop_reason}")
+                if stop_reason == "cancelled":
+                    print("\nSUCCESS: Cancel was handled correctly!")
+                    return 0
+                else:
+                    print(f"\nFAIL: Expected 'cancelled', got '{stop_reason}'")
+                    return 1
+
+    print("\nFAIL: No result received")
+    return 1
+
+
+def test_cancel(client, session_id):
+    assert run(client, session_id) == 0
 
 
 def main():
-    binary = "./target/release/crow-agent"
+    if not agent_available():
+        print(f"SKIP: {BINARY} not found; run cargo build --release")
+        return 2
 
     # Start the ACP server
-    print(f"Starting ACP server: {binary} acp")
-    proc = subprocess.Popen(
-        [binary, "acp"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1
-    )
+    print(f"Starting ACP server: {BINARY} acp")
+    client = Client()
 
     try:
         # Initialize
         print("Sending initialize...")
-        send_jsonrpc(proc, "initialize", {"protocolVersion": "0.1"}, 1)
-        resp = read_response(proc)
+        resp = client.initialize()
         if not resp or "result" not in resp:
             print(f"FAIL: Bad initialize response: {resp}")
             return 1
@@ -69,58 +103,17 @@ def main():
 
         # Create session
         print("Sending session/new...")
-        send_jsonrpc(proc, "session/new", {"cwd": "/tmp", "mcpServers": []}, 2)
-        resp = read_response(proc)
+        resp = client.new_session("/tmp")
         if not resp or "result" not in resp:
             print(f"FAIL: Bad session/new response: {resp}")
             return 1
         session_id = resp["result"]["sessionId"]
         print(f"  Session ID: {session_id}")
 
-        # Send a prompt that will take some time
-        print(f"\nSending prompt to session {session_id}...")
-        send_jsonrpc(proc, "session/prompt", {
-            "sessionId": session_id,
-            "prompt": [{"type": "text", "text": "Please think carefully and explain quantum physics in detail."}]
-        }, 3)
-
-        # Wait briefly then send cancel
-        cancel_delay = 0.5
-        print(f"Waiting {cancel_delay}s before cancel...")
-        time.sleep(cancel_delay)
-        print("Sending cancel notification...")
-        send_notification(proc, "session/cancel", {"sessionId": session_id})
-
-        # Read responses until we get the result
-        print("\nWaiting for response...")
-        for i in range(20):
-            resp = read_response(proc, timeout=2)
-            if resp:
-                if "method" in resp:
-                    # Notification
-                    update = resp.get("params", {}).get("update", {})
-                    update_type = update.get("sessionUpdate", "unknown")
-                    print(f"  Notification: {update_type}")
-                elif "result" in resp:
-                    if resp.get("id") == 3:
-                        stop_reason = resp["result"].get("stopReason")
-                        print(f"\n=== Result ===")
-                        print(f"Stop reason: {stop_reason}")
-                        if stop_reason == "cancelled":
-                            print("\nSUCCESS: Cancel was handled correctly!")
-                            return 0
-                        else:
-                            print(f"\nFAIL: Expected 'cancelled', got '{stop_reason}'")
-                            return 1
-            else:
-                print("  (timeout waiting for response)")
-
-        print("\nFAIL: No result received")
-        return 1
+        return run(client, session_id)
 
     finally:
-        proc.terminate()
-        proc.wait()
+        client.close()
 
 
 if __name__ == "__main__":
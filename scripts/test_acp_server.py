@@ -0,0 +1,130 @@
+"""Relay test against a tiny fake agent
+
+Checks that acp_server.py rewrites request ids so clients can't collide,
+that each session's updates only reach the client that created it, and
+that the relay stops accepting once the agent is gone.
+Needs no crow-agent build.
+
+Usage:
+    python3 -m pytest scripts/test_acp_server.py
+"""
+
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+from _acp_client import Client, LineReader
+from acp_server import Relay
+
+# Echoes each prompt back as one update, then ends the turn. Request ids
+# are used as given, so duplicates from different clients would collide.
+FAKE_AGENT = """\
+import json, sys
+
+sessions = 0
+for line in sys.stdin:
+    message = json.loads(line)
+    method, id = message.get("method"), message.get("id")
+    if method == "initialize":
+        result = {"protocolVersion": 1, "agentInfo": {"name": "fake"}}
+    elif method == "session/new":
+        sessions += 1
+        result = {"sessionId": f"s{sessions}"}
+    elif method == "session/prompt":
+        params = message["params"]
+        update = {
+            "sessionUpdate": "agent_message_chunk",
+            "content": params["prompt"][0],
+        }
+        print(json.dumps({
+            "jsonrpc": "2.0",
+            "method": "session/update",
+            "params": {"sessionId": params["sessionId"], "update": update},
+        }))
+        result = {"stopReason": "end_turn", "agentRequestId": id}
+    else:
+        continue
+    print(json.dumps({"jsonrpc": "2.0", "id": id, "result": result}), flush=True)
+"""
+
+
+@pytest.fixture
+def relay_server(tmp_path):
+    """(relay, socket path, serving thread) in front of the fake agent"""
+    agent = tmp_path / "fake-agent"
+    agent.write_text(f"#!{sys.executable}\n{FAKE_AGENT}")
+    agent.chmod(0o755)
+    relay = Relay(str(agent))
+    relay.start()
+
+    path = str(tmp_path / "relay.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    serving = threading.Thread(target=relay.serve, args=(server,), daemon=True)
+    serving.start()
+    try:
+        yield relay, path, serving
+    finally:
+        server.close()
+        relay.close()
+
+
+def test_relay_routes_by_id_and_session(relay_server):
+    _, path, _ = relay_server
+    alice = Client(socket_path=path)
+    bob = Client(socket_path=path)
+    try:
+        for client in (alice, bob):
+            resp = client.initialize()
+            assert resp["result"]["agentInfo"]["name"] == "fake"
+        # Both clients number their requests from 1, so these collide
+        # unless the relay rewrites them
+        alice_session = alice.new_session()["result"]["sessionId"]
+        bob_session = bob.new_session()["result"]["sessionId"]
+        assert alice_session != bob_session
+
+        alice_id = alice.prompt(alice_session, "from alice")
+        bob_id = bob.prompt(bob_session, "from bob")
+        assert alice_id == bob_id
+
+        alice_resp, alice_text = alice.wait_result(alice_id, timeout=10)
+        bob_resp, bob_text = bob.wait_result(bob_id, timeout=10)
+        assert alice_resp["id"] == alice_id and bob_resp["id"] == bob_id
+        agent_ids = {r["result"]["agentRequestId"] for r in (alice_resp, bob_resp)}
+        assert len(agent_ids) == 2
+
+        # No session filter here: the relay alone must keep the streams apart
+        assert alice_text == "from alice"
+        assert bob_text == "from bob"
+        assert alice.read(timeout=0.2) is None
+        assert bob.read(timeout=0.2) is None
+    finally:
+        alice.close()
+        bob.close()
+
+
+def test_relay_stops_serving_when_agent_exits(relay_server):
+    relay, _, serving = relay_server
+    relay.proc.kill()
+    serving.join(timeout=5)
+    assert not serving.is_alive()
+
+
+def test_read_lines_returns_lines_left_by_readline():
+    # The relay reads its handshake with readline(), which can buffer the
+    # lines after it; read_lines() must hand those over without blocking
+    r, w = os.pipe()
+    os.write(w, b'{"id":0}\n{"method":"a"}\n{"method":"b"}\n')
+    os.close(w)
+    try:
+        reader = LineReader(r)
+        assert reader.readline() == b'{"id":0}'
+        assert reader.read_lines() == [b'{"method":"a"}', b'{"method":"b"}']
+        assert reader.read_lines() is None
+    finally:
+        os.close(r)
@@ -9,124 +9,149 @@ This test:
 
 Usage:
     uv run scripts/test_full_workflow.py
+    CROW_TEST_VERBOSE=1 uv run scripts/test_full_workflow.py  # print every tool call
 """
 
-import json
+import io
 import os
-import select
-import subprocess
 import sys
 import time
 
+from _acp_client import BINARY, VERBOSE, Client, agent_available, prebuild_prompt
 
-def send_jsonrpc(proc, method, params, id):
-    """Send JSON-RPC request"""
-    request = {"jsonrpc": "2.0", "method": method, "params": params, "id": id}
-    msg = json.dumps(request)
-    proc.stdin.write(msg + "\n")
-    proc.stdin.flush()
 
+def _on_text(update, state):
+    text = state["text"]
+    if state["text_limit"] is None or text.tell() <= state["text_limit"]:
+        text.write(update["content"].get("text", ""))
 
-def read_response(proc, timeout=30):
-    """Read JSON-RPC response with timeout"""
-    ready, _, _ = select.select([proc.stdout], [], [], timeout)
-    if ready:
-        line = proc.stdout.readline()
-        if line:
-            return json.loads(line)
-    return None
 
+def _on_tool(update, state):
+    state["tool_calls"].append(
+        {
+            "id": update.get("toolCallId"),
+            "title": update.get("title"),
+            "kind": update.get("kind"),
+            "input": update.get("rawInput"),
+        }
+    )
+    if VERBOSE:
+        print(f"  [TOOL] {update.get('title')}")
 
-def wait_for_result(proc, expected_id, timeout=120):
-    """Read until we get a result with the expected id, collecting events"""
-    text_chunks = []
-    tool_calls = []
-    tool_updates = []
-    plans = []
 
-    start = time.time()
-    while time.time() - start < timeout:
-        resp = read_response(proc, timeout=5)
+def _on_tool_done(update, state):
+    state["tool_updates"].append(
+        {"id": update.get("toolCallId"), "status": update.get("status")}
+    )
+    if VERBOSE:
+        print(f"  [TOOL DONE] {update.get('toolCallId')} - {update.get('status')}")
+
+
+def _on_plan(update, state):
+    entries = update.get("entries", [])
+    state["plans"].append(entries)
+    print(f"  [PLAN] {len(entries)} entries:")
+    for e in entries:
+        status = e.get("status", "?")
+        content = e.get("content", "?")
+        print(f"    [{status}] {content}")
+
+
+def _on_unknown(update, state):
+    pass
+
+
+# session/update handlers keyed by sessionUpdate type
+HANDLERS = {
+    "agent_message_chunk": _on_text,
+    "tool_call": _on_tool,
+    "tool_call_update": _on_tool_done,
+    "plan": _on_plan,
+}
+
+
+def wait_for_result(client, expected_id, timeout=120, text_limit=None):
+    """Read until we get a result with the expected id, collecting events
+
+    Returns None if the prompt fails or the timeout expires. With
+    `text_limit`, agent text stops being kept once it is longer than that,
+    since only a preview of it is printed.
+    """
+    state = {
+        "text": io.StringIO(),
+        "text_limit": text_limit,
+        "tool_calls": [],
+        "tool_updates": [],
+        "plans": [],
+    }
+
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        resp = client.read(timeout=remaining)
         if not resp:
             continue
         if "method" in resp and resp["method"] == "session/update":
             update = resp["params"]["update"]
             update_type = update.get("sessionUpdate", "unknown")
+            HANDLERS.get(update_type, _on_unknown)(update, state)
 
-            if update_type == "agent_message_chunk":
-                text = update["content"].get("text", "")
-                text_chunks.append(text)
-            elif update_type == "tool_call":
-                tool_calls.append(
-                    {
-                        "id": update.get("toolCallId"),
-                        "title": update.get("title"),
-                        "kind": update.get("kind"),
-                        "input": update.get("rawInput"),
-                    }
-                )
-                print(f"  [TOOL] {update.get('title')}")
-            elif update_type == "tool_call_update":
-                tool_updates.append(
-                    {"id": update.get("toolCallId"), "status": update.get("status")}
-                )
-                print(
-                    f"  [TOOL DONE] {update.get('toolCallId')} - {update.get('status')}"
-                )
-            elif update_type == "plan":
-                entries = update.get("entries", [])
-                plans.append(entries)
-                print(f"  [PLAN] {len(entries)} entries:")
-                for e in entries:
-                    status = e.get("status", "?")
-                    content = e.get("content", "?")
-                    print(f"    [{status}] {content}")
-
-        elif "result" in resp and resp.get("id") == expected_id:
+        elif resp.get("id") == expected_id:
+            if "result" not in resp:
+                print(f"  [ERROR] {resp.get('error')}")
+                return None
             return {
                 "result": resp["result"],
-                "text": "".join(text_chunks),
-                "tool_calls": tool_calls,
-                "tool_updates": tool_updates,
-                "plans": plans,
+                "text": state["text"].getvalue(),
+                "tool_calls": state["tool_calls"],
+                "tool_updates": state["tool_updates"],
+                "plans": state["plans"],
             }
     return None
 
 
+PROMPT1 = prebuild_prompt(
+    """I need you to modify hello.py to change "Hello World" to "Hello Universe", then run it to verify.
+
+First, use the todo_write tool to create a plan with these steps:
+1. Read hello.py
+2. Edit hello.py to change Hello World to Hello Universe
+3. Run hello.py to verify the change
+
+Just create the plan for now, don't execute yet."""
+)
+PROMPT2 = prebuild_prompt("""Now execute the plan:
+1. Read hello.py to see its current contents
+2. Edit it to change "Hello World" to "Hello Universe"
+3. Run it with the terminal tool to verify it works""")
+
+
 def main():
+    if not agent_available():
+        print(f"SKIP: {BINARY} not found; run cargo build --release")
+        return 2
+
     # Setup test directory
     test_dir = "/tmp/crow_test"
     os.makedirs(test_dir, exist_ok=True)
     with open(f"{test_dir}/hello.py", "w") as f:
         f.write('print("Hello World")\n')
 
-    binary = "./target/release/crow-agent"
-
     print(f"=== Full Workflow Test ===")
     print(f"Test directory: {test_dir}")
     print(f"Starting ACP server...\n")
 
-    proc = subprocess.Popen(
-        [binary, "acp"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-    )
+    client = Client()
 
     try:
         # Initialize
-        send_jsonrpc(proc, "initialize", {"protocolVersion": "0.1"}, 1)
-        resp = read_response(proc)
+        resp = client.initialize()
         if not resp or "result" not in resp:
             print("FAIL: Initialize failed")
             return 1
         print("Initialized OK\n")
 
         # Create session with test directory as cwd
-        send_jsonrpc(proc, "session/new", {"cwd": test_dir, "mcpServers": []}, 2)
-        resp = read_response(proc)
+        resp = client.new_session(test_dir)
         if not resp or "result" not in resp:
             print("FAIL: Session creation failed")
             return 1
@@ -137,23 +162,8 @@ def main():
         print("=" * 60)
         print("PROMPT 1: Plan the task")
         print("=" * 60)
-        prompt1 = """I need you to modify hello.py to change "Hello World" to "Hello Universe", then run it to verify.
-
-First, use the todo_write tool to create a plan with these steps:
-1. Read hello.py
-2. Edit hello.py to change Hello World to Hello Universe
-3. Run hello.py to verify the change
-
-Just create the plan for now, don't execute yet."""
-
-        send_jsonrpc(
-            proc,
-            "session/prompt",
-            {"sessionId": session_id, "prompt": [{"type": "text", "text": prompt1}]},
-            3,
-        )
-
-        result = wait_for_result(proc, 3)
+        prompt_id = client.prompt(session_id, PROMPT1)
+        result = wait_for_result(client, prompt_id, text_limit=300)
         if not result:
             print("FAIL: No response to prompt 1")
             return 1
@@ -172,19 +182,8 @@ Just create the plan for now, don't execute yet."""
         print("\n" + "=" * 60)
         print("PROMPT 2: Execute the plan")
         print("=" * 60)
-        prompt2 = """Now execute the plan:
-1. Read hello.py to see its current contents
-2. Edit it to change "Hello World" to "Hello Universe"
-3. Run it with the terminal tool to verify it works"""
-
-        send_jsonrpc(
-            proc,
-            "session/prompt",
-            {"sessionId": session_id, "prompt": [{"type": "text", "text": prompt2}]},
-            4,
-        )
-
-        result = wait_for_result(proc, 4)
+        prompt_id = client.prompt(session_id, PROMPT2)
+        result = wait_for_result(client, prompt_id, text_limit=500)
         if not result:
             print("FAIL: No response to prompt 2")
             return 1
@@ -215,8 +214,7 @@ Just create the plan for now, don't execute yet."""
             return 1
 
     finally:
-        proc.terminate()
-        proc.wait()
+        client.close()
 
 
 if __name__ == "__main__":